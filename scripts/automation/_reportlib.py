@@ -0,0 +1,126 @@
+"""Shared plumbing for the SaneApps report scripts (ls-sales.py, dl-report.py).
+
+Keychain/API-key lookup, keep-alive HTTPS GETs, the on-disk cache under
+~/.cache/saneapps, JSON (orjson when installed) and small grouping/output
+helpers. Scripts in this directory import it directly:
+
+  from _reportlib import get_api_key, http_get, ...
+"""
+import http.client
+import json
+import os
+import subprocess
+import sys
+import time
+
+try:
+    import orjson  # optional: several times faster than stdlib json
+except ImportError:
+    orjson = None
+
+
+CACHE_DIR = os.path.expanduser("~/.cache/saneapps")
+KEY_CACHE_TTL = 24 * 60 * 60  # seconds; re-read the keychain once a day
+
+
+def get_api_key(env_var, service, label, use_cache=True):
+    """API key from env_var, the cached keychain copy, or the keychain itself."""
+    # Try env var first (headless/LaunchAgent contexts)
+    key = os.environ.get(env_var, "")
+    if key:
+        return key
+    # Then the owner-only cached copy, which skips a `security` fork + keychain IPC
+    key_cache = _key_cache_path(service)
+    if use_cache:
+        key = load_cache(key_cache, KEY_CACHE_TTL)
+        if isinstance(key, str) and key:
+            return key
+    # Fall back to keychain (interactive sessions)
+    result = subprocess.run(
+        ["security", "find-generic-password", "-s", service, "-a", "api_key", "-w"],
+        capture_output=True, text=True,
+    )
+    key = result.stdout.strip()
+    if not key:
+        print(f"Error: No {label} API key found.", file=sys.stderr)
+        print(f"  Set {env_var} env var, or add to keychain:", file=sys.stderr)
+        print(f"  security add-generic-password -s {service} -a api_key -w YOUR_KEY", file=sys.stderr)
+        sys.exit(1)
+    save_cache(key_cache, key)
+    return key
+
+
+def forget_api_key(service):
+    """Delete the cached keychain copy of a rejected key; True if one existed."""
+    try:
+        os.remove(_key_cache_path(service))
+    except OSError:
+        return False
+    print("  Cleared the cached API key; the next run re-reads the keychain.", file=sys.stderr)
+    return True
+
+
+def _key_cache_path(service):
+    return os.path.join(CACHE_DIR, "keys", f"{service}.json")
+
+
+def http_get(conn, path, headers, retries=2):
+    """GET over a persistent connection, reconnecting if the server dropped it."""
+    for attempt in range(retries + 1):
+        try:
+            conn.request("GET", path, headers=headers)
+            return conn.getresponse().read()
+        except (OSError, http.client.HTTPException):
+            conn.close()  # next request() reopens the socket
+            if attempt == retries:
+                raise
+            time.sleep(0.2 * (2 ** attempt))
+
+
+def json_loads(data):
+    """Parse JSON from bytes or str, with orjson when it's installed."""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def json_dumps(obj, indent=False):
+    """Serialize obj to a JSON string (non-ASCII as UTF-8), with orjson when it's installed."""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False)
+
+
+def load_cache(path, ttl):
+    """Return cached JSON from path if younger than ttl seconds, else None."""
+    try:
+        if time.time() - os.path.getmtime(path) > ttl:
+            return None
+        with open(path, "rb") as f:
+            return json_loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def save_cache(path, data):
+    """Atomically write data as JSON, readable by the owner only."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(json_dumps(data))
+        os.replace(tmp, path)
+    except OSError:
+        pass  # Cache is best-effort; the report still runs without it
+
+
+def factorize(values):
+    """Map each value to a small-int code; returns (codes, uniques in first-appearance order)."""
+    index = {}
+    setdefault = index.setdefault
+    codes = [setdefault(v, len(index)) for v in values]
+    return codes, list(index)
+
+
+def write_lines(lines):
+    """Emit a report section with a single stdout write."""
+    sys.stdout.write("\n".join(lines) + "\n")
@@ -9,167 +9,194 @@ Usage:
   dl-report.py --days 7     # Last 7 days
   dl-report.py --app sanebar # Filter by app
   dl-report.py --json       # Raw JSON output (for piping)
+  dl-report.py --refresh    # Ignore the on-disk stats/key caches
 """
 import argparse
+import heapq
+import http.client
 import json
 import os
-import subprocess
 import sys
 from collections import defaultdict
-from datetime import datetime
-
-
-API_BASE = "https://dist.saneapps.com/api/stats"
-
-
-def get_api_key():
-    # Try env var first (headless/LaunchAgent contexts)
-    key = os.environ.get("DIST_ANALYTICS_KEY", "")
-    if key:
-        return key
-    # Fall back to keychain (interactive sessions)
-    result = subprocess.run(
-        ["security", "find-generic-password", "-s", "dist-analytics", "-a", "api_key", "-w"],
-        capture_output=True, text=True,
-    )
-    key = result.stdout.strip()
-    if not key:
-        print("Error: No dist analytics API key found.", file=sys.stderr)
-        print("  Set DIST_ANALYTICS_KEY env var, or add to keychain:", file=sys.stderr)
-        print("  security add-generic-password -s dist-analytics -a api_key -w YOUR_KEY", file=sys.stderr)
-        sys.exit(1)
-    return key
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+from _reportlib import (
+    CACHE_DIR, factorize, forget_api_key, get_api_key, http_get, json_dumps,
+    json_loads, load_cache, save_cache, write_lines,
+)
+
+
+API_HOST = "dist.saneapps.com"
+API_PATH = "/api/stats"
+KEY_SERVICE = "dist-analytics"  # keychain service holding the API key
+STATS_CACHE_TTL = 15 * 60  # seconds; only today's counts are still moving
+
+# Per-source counts live in fixed-slot lists: [sparkle, homebrew, website, unknown, total]
+SOURCES = ("sparkle", "homebrew", "website", "unknown")
+SOURCE_IDX = {source: i for i, source in enumerate(SOURCES)}
+TOTAL = len(SOURCES)
 
+# Date-bucket bits from classify_dates(); every row is already in the window
+TODAY, YESTERDAY, WEEK = 1, 2, 4
 
-def fetch_stats(api_key, days=90, app=None):
-    from urllib.parse import urlencode
+
+def fetch_stats(api_key, days=90, app=None, use_cache=True):
+    cache_path = os.path.join(CACHE_DIR, f"dist-stats-{days}-{app or 'all'}.json")
+    if use_cache:
+        cached = load_cache(cache_path, STATS_CACHE_TTL)
+        if cached is not None:
+            return cached
     params = {"days": days}
     if app:
         params["app"] = app
-    url = f"{API_BASE}?{urlencode(params)}"
-    result = subprocess.run(
-        ["curl", "-s", "--max-time", "15", url,
-         "-H", f"Authorization: Bearer {api_key}"],
-        capture_output=True, text=True,
-    )
+    headers = {"Authorization": f"Bearer {api_key}"}
+    conn = http.client.HTTPSConnection(API_HOST, timeout=15)
+    try:
+        body = http_get(conn, f"{API_PATH}?{urlencode(params)}", headers)
+    except (OSError, http.client.HTTPException) as e:
+        print(f"Error: API request failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        conn.close()
     try:
-        return json.loads(result.stdout)
+        data = json_loads(body)
     except json.JSONDecodeError:
-        print(f"Error: Bad API response: {result.stdout[:200]}", file=sys.stderr)
+        print(f"Error: Bad API response: {body[:200].decode(errors='replace')}", file=sys.stderr)
         sys.exit(1)
+    if "rows" in data:
+        save_cache(cache_path, data)
+    else:
+        # No rows usually means the Worker rejected a rotated or revoked key
+        print(f"Error: Unexpected API response: {body[:200].decode(errors='replace')}", file=sys.stderr)
+        forget_api_key(KEY_SERVICE)
+    return data
 
 
-def print_daily(rows, window_days=90):
-    """Today / Yesterday / This Week / Window breakdown."""
-    # Worker stores dates in UTC, so bucket using UTC to match
-    from datetime import timedelta, timezone
-    now = datetime.now(timezone.utc)
+def classify_dates(rows, now):
+    """Date-bucket bitmask (TODAY / YESTERDAY / WEEK) for each row, via ISO string comparisons."""
     today = now.strftime("%Y-%m-%d")
     yesterday = (now - timedelta(days=1)).strftime("%Y-%m-%d")
-    week_dates = set((now - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(7))
-    window_label = f"Last {window_days}d"
-
-    buckets = {
-        "Today": defaultdict(int),
-        "Yesterday": defaultdict(int),
-        "This Week": defaultdict(int),
-        window_label: defaultdict(int),
-    }
+    week_floor = (now - timedelta(days=6)).strftime("%Y-%m-%d")
 
+    masks = []
+    append = masks.append
     for r in rows:
-        count = r["count"]
-        source = r["source"]
         date = r["date"]
+        mask = WEEK if date >= week_floor else 0
+        if date == today:
+            mask |= TODAY
+        elif date == yesterday:
+            mask |= YESTERDAY
+        append(mask)
+    return masks
 
-        buckets[window_label][source] += count
-        buckets[window_label]["total"] += count
 
-        if date in week_dates:
-            buckets["This Week"][source] += count
-            buckets["This Week"]["total"] += count
+def print_daily(rows, window_days=90):
+    """Today / Yesterday / This Week / Window breakdown."""
+    # Worker stores dates in UTC, so bucket using UTC to match
+    now = datetime.now(timezone.utc)
+    window_label = f"Last {window_days}d"
 
-        if date == today:
-            buckets["Today"][source] += count
-            buckets["Today"]["total"] += count
-        elif date == yesterday:
-            buckets["Yesterday"][source] += count
-            buckets["Yesterday"]["total"] += count
+    today_b, yesterday_b, week_b, window_b = ([0] * (TOTAL + 1) for _ in range(4))
+    source_idx = SOURCE_IDX.get
 
-    print(f"{'Period':<15} {'Total':>7} {'Sparkle':>9} {'Homebrew':>9} {'Website':>9} {'Unknown':>9}")
-    print("-" * 60)
-    for name in ["Today", "Yesterday", "This Week", window_label]:
-        b = buckets[name]
-        print(f"{name:<15} {b['total']:>7} {b.get('sparkle', 0):>9} {b.get('homebrew', 0):>9} {b.get('website', 0):>9} {b.get('unknown', 0):>9}")
+    for r, mask in zip(rows, classify_dates(rows, now)):
+        count = r["count"]
+        i = source_idx(r["source"])
+
+        if i is not None:
+            window_b[i] += count
+        window_b[TOTAL] += count
+
+        if mask & WEEK:
+            if i is not None:
+                week_b[i] += count
+            week_b[TOTAL] += count
+
+        if mask & TODAY:
+            if i is not None:
+                today_b[i] += count
+            today_b[TOTAL] += count
+        elif mask & YESTERDAY:
+            if i is not None:
+                yesterday_b[i] += count
+            yesterday_b[TOTAL] += count
+
+    row = "{:<15} {:>7} {:>9} {:>9} {:>9} {:>9}".format
+    lines = [row("Period", "Total", "Sparkle", "Homebrew", "Website", "Unknown"), "-" * 60]
+    for name, b in [("Today", today_b), ("Yesterday", yesterday_b), ("This Week", week_b), (window_label, window_b)]:
+        sparkle, homebrew, website, unknown, total = b
+        lines.append(row(name, total, sparkle, homebrew, website, unknown))
+    write_lines(lines)
+
+
+def count_by_source(rows, codes, n):
+    """Fixed-slot per-source counts for each of n factorized groups."""
+    counts = [[0] * (TOTAL + 1) for _ in range(n)]
+    source_idx = SOURCE_IDX.get
+    for code, r in zip(codes, rows):
+        c = counts[code]
+        count = r["count"]
+        i = source_idx(r["source"])
+        if i is not None:
+            c[i] += count
+        c[TOTAL] += count
+    return counts
 
 
 def print_by_app(rows):
     """Downloads grouped by app."""
-    apps = defaultdict(lambda: defaultdict(int))
+    codes, apps = factorize([r["app"] for r in rows])
+    counts = count_by_source(rows, codes, len(apps))
 
-    for r in rows:
-        app = r["app"]
-        apps[app][r["source"]] += r["count"]
-        apps[app]["total"] += r["count"]
-
-    print(f"\n{'App':<15} {'Total':>7} {'Sparkle':>9} {'Homebrew':>9} {'Website':>9} {'Unknown':>9}")
-    print("-" * 60)
-    for app in sorted(apps, key=lambda a: apps[a]["total"], reverse=True):
-        a = apps[app]
-        print(f"{app:<15} {a['total']:>7} {a.get('sparkle', 0):>9} {a.get('homebrew', 0):>9} {a.get('website', 0):>9} {a.get('unknown', 0):>9}")
+    row = "{:<15} {:>7} {:>9} {:>9} {:>9} {:>9}".format
+    lines = ["", row("App", "Total", "Sparkle", "Homebrew", "Website", "Unknown"), "-" * 60]
+    for k in sorted(range(len(apps)), key=lambda k: counts[k][TOTAL], reverse=True):
+        sparkle, homebrew, website, unknown, total = counts[k]
+        lines.append(row(apps[k], total, sparkle, homebrew, website, unknown))
+    write_lines(lines)
 
 
 def print_by_version(rows):
     """Downloads grouped by version."""
-    versions = defaultdict(lambda: {"count": 0, "source": defaultdict(int)})
-
-    for r in rows:
-        key = f"{r['app']} {r['version']}"
-        versions[key]["count"] += r["count"]
-        versions[key]["source"][r["source"]] += r["count"]
+    # Factorize on the (app, version) pair; labels are only formatted for printed rows
+    codes, versions = factorize([(r["app"], r["version"]) for r in rows])
+    counts = count_by_source(rows, codes, len(versions))
 
-    print(f"\n{'App Version':<25} {'Total':>7} {'Sparkle':>9} {'Website':>9}")
-    print("-" * 50)
-    for key in sorted(versions, key=lambda k: versions[k]["count"], reverse=True)[:20]:
-        v = versions[key]
-        print(f"{key:<25} {v['count']:>7} {v['source'].get('sparkle', 0):>9} {v['source'].get('website', 0):>9}")
+    row = "{:<25} {:>7} {:>9} {:>9}".format
+    lines = ["", row("App Version", "Total", "Sparkle", "Website"), "-" * 50]
+    for k in heapq.nlargest(20, range(len(versions)), key=lambda k: counts[k][TOTAL]):
+        sparkle, _, website, _, total = counts[k]
+        lines.append(row("{} {}".format(*versions[k]), total, sparkle, website))
+    write_lines(lines)
 
 
 def print_events(events, window_days=90):
     """User-type event breakdown: Today / Yesterday / This Week / Window."""
-    from datetime import timedelta, timezone
     now = datetime.now(timezone.utc)
     today = now.strftime("%Y-%m-%d")
-    yesterday = (now - timedelta(days=1)).strftime("%Y-%m-%d")
-    week_dates = set((now - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(7))
     window_label = f"Last {window_days}d"
 
-    event_types = ["new_free_user", "early_adopter_grant", "license_activated"]
-    buckets = {
-        "Today": defaultdict(int),
-        "Yesterday": defaultdict(int),
-        "This Week": defaultdict(int),
-        window_label: defaultdict(int),
-    }
+    today_b, yesterday_b, week_b, window_b = (defaultdict(int) for _ in range(4))
 
-    for r in events:
+    for r, mask in zip(events, classify_dates(events, now)):
         count = r["count"]
         event = r["event"]
-        date = r["date"]
 
-        buckets[window_label][event] += count
-        if date in week_dates:
-            buckets["This Week"][event] += count
-        if date == today:
-            buckets["Today"][event] += count
-        elif date == yesterday:
-            buckets["Yesterday"][event] += count
+        window_b[event] += count
+        if mask & WEEK:
+            week_b[event] += count
+        if mask & TODAY:
+            today_b[event] += count
+        elif mask & YESTERDAY:
+            yesterday_b[event] += count
 
-    print(f"\nUser Events — {today}")
-    print(f"{'Period':<15} {'New Free':>10} {'Early Adopter':>15} {'Activated':>11}")
-    print("-" * 55)
-    for name in ["Today", "Yesterday", "This Week", window_label]:
-        b = buckets[name]
-        print(f"{name:<15} {b.get('new_free_user', 0):>10} {b.get('early_adopter_grant', 0):>15} {b.get('license_activated', 0):>11}")
+    row = "{:<15} {:>10} {:>15} {:>11}".format
+    lines = ["", f"User Events — {today}", row("Period", "New Free", "Early Adopter", "Activated"), "-" * 55]
+    for name, b in [("Today", today_b), ("Yesterday", yesterday_b), ("This Week", week_b), (window_label, window_b)]:
+        lines.append(row(name, b.get("new_free_user", 0), b.get("early_adopter_grant", 0), b.get("license_activated", 0)))
+    write_lines(lines)
 
 
 def main():
@@ -179,14 +206,14 @@ def main():
     parser.add_argument("--app", type=str, help="Filter by app name (e.g. sanebar)")
     parser.add_argument("--json", action="store_true", help="Raw JSON output")
     parser.add_argument("--events", action="store_true", help="Show user-type events only")
+    parser.add_argument("--refresh", action="store_true", help="Bypass the on-disk stats and API key caches")
     args = parser.parse_args()
 
-    api_key = get_api_key()
-    data = fetch_stats(api_key, days=args.days, app=args.app)
+    api_key = get_api_key("DIST_ANALYTICS_KEY", KEY_SERVICE, "dist analytics", use_cache=not args.refresh)
+    data = fetch_stats(api_key, days=args.days, app=args.app, use_cache=not args.refresh)
 
     if args.json:
-        json.dump(data, sys.stdout, indent=2)
-        print()
+        sys.stdout.write(json_dumps(data, indent=True) + "\n")
         return
 
     events = data.get("events", [])
@@ -10,64 +10,230 @@ Usage:
   ls-sales.py --fees       # Fee breakdown only
   ls-sales.py --products   # Revenue by product
   ls-sales.py --json       # Raw JSON output (for piping)
+  ls-sales.py --refresh    # Ignore the on-disk order/key caches
 """
 import argparse
-import json
+import heapq
+import http.client
 import os
-import subprocess
 import sys
-from collections import defaultdict
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+from _reportlib import (
+    CACHE_DIR, factorize, forget_api_key, get_api_key, http_get, json_dumps,
+    json_loads, load_cache, save_cache, write_lines,
+)
+
+
+API_HOST = "api.lemonsqueezy.com"
+KEY_SERVICE = "lemonsqueezy"  # keychain service holding the API key
+PAGE_SIZE = 50
+FETCH_WORKERS = 8
+# JSON:API sparse fieldset: only the order attributes project_order() reads
+ORDER_FIELDS = "created_at,status,subtotal_usd,tax_usd,currency,refunded,first_order_item"
+ORDERS_CACHE = os.path.join(CACHE_DIR, "ls-orders.json")
+ORDERS_CACHE_TTL = 15 * 60  # seconds; served as-is, then topped up with new orders
+ORDERS_FULL_REFRESH = 24 * 60 * 60  # seconds; re-walk every page to catch refunds on old orders
+ORDERS_CACHE_SCHEMA = 4  # bump when project_order() or the cache payload changes shape
+# Estimated LS fee schedule: 5% + 50c per order, plus 1.5% on non-USD orders
+PLATFORM_PER_MILLE = 50
+INTL_PER_MILLE = 15
+FLAT_FEE_CENTS = 50
+# datetime.fromisoformat() accepts a trailing "Z" natively from Python 3.11
+FROMISO_ACCEPTS_Z = sys.version_info >= (3, 11)
+
+
+def fetch_orders(api_key, use_cache=True):
+    """All orders: from the cache, the cache plus new orders, or a full download."""
+    now = time.time()
+    cached = load_cache(ORDERS_CACHE, ORDERS_FULL_REFRESH) if use_cache else None
+    if (
+        isinstance(cached, dict)
+        and cached.get("schema") == ORDERS_CACHE_SCHEMA
+        and now - cached["full_at"] < ORDERS_FULL_REFRESH
+    ):
+        if now - cached["fetched_at"] < ORDERS_CACHE_TTL:
+            return cached["orders"]
+        orders = download_new_orders(api_key, cached["orders"])
+        if orders is not None:
+            save_cache(ORDERS_CACHE, dict(cached, fetched_at=now, orders=orders))
+            return orders
+
+    orders, complete = download_orders(api_key)
+    if complete:
+        save_cache(ORDERS_CACHE, {
+            "schema": ORDERS_CACHE_SCHEMA, "full_at": now, "fetched_at": now, "orders": orders,
+        })
+    return orders
+
+
+def project_order(o):
+    """Flatten a JSON:API order down to the fields the reports read."""
+    a = o["attributes"]
+    item = a.get("first_order_item") or {}
+    currency = a.get("currency", "USD")
+    return {
+        "id": o.get("id"),
+        "created_at": normalize_timestamp(a["created_at"]),
+        "status": a.get("status"),
+        "subtotal_usd": a.get("subtotal_usd", 0),
+        "tax_usd": a.get("tax_usd", 0),
+        "currency": currency,
+        "intl": 0 if currency == "USD" else 1,  # surcharge multiplier, see order_fee()
+        "product_name": item.get("product_name", "Unknown"),
+        "variant_name": item.get("variant_name"),
+        "refunded": a.get("refunded", False),
+    }
 
 
-def get_api_key():
-    # Try env var first (headless/LaunchAgent contexts)
-    key = os.environ.get("LEMONSQUEEZY_API_KEY", "")
-    if key:
-        return key
-    # Fall back to keychain (interactive sessions)
-    result = subprocess.run(
-        ["security", "find-generic-password", "-s", "lemonsqueezy", "-a", "api_key", "-w"],
-        capture_output=True, text=True,
-    )
-    key = result.stdout.strip()
-    if not key:
-        print("Error: No LemonSqueezy API key found.", file=sys.stderr)
-        print("  Set LEMONSQUEEZY_API_KEY env var, or add to keychain:", file=sys.stderr)
-        print("  security add-generic-password -s lemonsqueezy -a api_key -w YOUR_KEY", file=sys.stderr)
-        sys.exit(1)
-    return key
+def order_headers(api_key):
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Accept": "application/vnd.api+json",
+    }
 
 
-def fetch_orders(api_key):
-    all_orders = []
+def get_order_page(conn, headers, page, fields):
+    """Return (projected orders, lastPage or None) for one /v1/orders page."""
+    query = urlencode({"page[size]": PAGE_SIZE, "page[number]": page, **fields})
+    data = json_loads(http_get(conn, f"/v1/orders?{query}", headers))
+    if "errors" in data:
+        raise ValueError(data["errors"])
+    # Project right away so the full JSON:API envelope is freed per page
+    orders = [project_order(o) for o in data.get("data", [])]
+    return orders, ((data.get("meta") or {}).get("page") or {}).get("lastPage")
+
+
+def download_new_orders(api_key, cached):
+    """Cached orders topped up with everything newer, or None if that can't be trusted."""
+    known = {o["id"] for o in cached}
+    headers = order_headers(api_key)
+    conn = http.client.HTTPSConnection(API_HOST, timeout=15)
+    fresh = []
     page = 1
-    while True:
-        result = subprocess.run(
-            ["curl", "-s", "-g", "--max-time", "15",
-             f"https://api.lemonsqueezy.com/v1/orders?page[size]=50&page[number]={page}",
-             "-H", f"Authorization: Bearer {api_key}",
-             "-H", "Accept: application/vnd.api+json"],
-            capture_output=True, text=True,
-        )
+    try:
+        while True:
+            orders, _ = get_order_page(conn, headers, page, {"fields[orders]": ORDER_FIELDS})
+            stamps = [o["created_at"] for o in orders]
+            if stamps != sorted(stamps, reverse=True):
+                return None
+            fresh.extend(orders)
+            if len(orders) < PAGE_SIZE:
+                return fresh  # Walked every page: this is the full list
+            if any(o["id"] in known for o in orders):
+                break
+            page += 1
+    except (OSError, http.client.HTTPException, ValueError, KeyError):
+        return None
+    finally:
+        conn.close()
+    fresh_ids = {o["id"] for o in fresh}
+    return fresh + [o for o in cached if o["id"] not in fresh_ids]
+
+
+def download_orders(api_key):
+    """Fetch every order page, projected. Returns (orders, complete)."""
+    # Page 1 reports lastPage, so the remaining pages are fetched in parallel.
+    # http.client connections aren't thread-safe: each worker keeps its own
+    # keep-alive connection and reuses it for every page it pulls.
+    headers = order_headers(api_key)
+    local = threading.local()
+    conns = []
+    fields = {"fields[orders]": ORDER_FIELDS}
+
+    def get_page(page):
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPSConnection(API_HOST, timeout=15)
+            conns.append(conn)
+        return get_order_page(conn, headers, page, fields)
+
+    fetch_errors = (OSError, http.client.HTTPException, ValueError, KeyError)
+    all_orders = []
+    complete = True
+    try:
         try:
-            data = json.loads(result.stdout)
-        except json.JSONDecodeError:
-            print(f"Error: Bad API response on page {page}", file=sys.stderr)
-            break
-        orders = data.get("data", [])
+            try:
+                orders, last_page = get_page(1)
+            except ValueError:
+                # Sparse fieldset rejected: fall back to full order records
+                fields = {}
+                orders, last_page = get_page(1)
+        except fetch_errors as e:
+            print("Error: Bad API response on page 1", file=sys.stderr)
+            if isinstance(e, ValueError):
+                # An errors body here is usually a rotated or revoked key
+                forget_api_key(KEY_SERVICE)
+            return all_orders, False
         all_orders.extend(orders)
-        if len(orders) < 50:
-            break
-        page += 1
-    return all_orders
-
 
-def calc_fee(subtotal, currency):
-    """Calculate estimated LS fee for an order."""
-    base = (subtotal * 0.05) + 0.50
-    intl = subtotal * 0.015 if currency != "USD" else 0
-    return base + intl, intl
+        if last_page is None:
+            # No pagination meta: walk pages until a short one comes back
+            page = 1
+            while len(orders) == PAGE_SIZE:
+                page += 1
+                try:
+                    orders, _ = get_page(page)
+                except fetch_errors:
+                    print(f"Error: Bad API response on page {page}", file=sys.stderr)
+                    complete = False
+                    break
+                all_orders.extend(orders)
+        elif last_page > 1:
+            pages = range(2, last_page + 1)
+            with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(pages))) as pool:
+                futures = [pool.submit(get_page, page) for page in pages]
+                # Collect in page order so all_orders keeps the API's ordering
+                for page, future in zip(pages, futures):
+                    try:
+                        all_orders.extend(future.result()[0])
+                    except fetch_errors:
+                        print(f"Error: Bad API response on page {page}", file=sys.stderr)
+                        complete = False
+                        for f in futures:
+                            f.cancel()
+                        break
+    finally:
+        for conn in conns:
+            conn.close()
+    return all_orders, complete
+
+
+def per_mille(cents, rate):
+    """cents * rate / 1000, rounded half-up to a whole cent."""
+    return (cents * rate + 500) // 1000
+
+
+def order_fee(subtotal, intl):
+    """Estimated LS fee in cents: 5% + 50c, plus 1.5% when the intl flag is 1."""
+    return per_mille(fee_milli(subtotal, intl), 1)
+
+
+def fee_milli(subtotal, intl):
+    """Exact order_fee() in thousandths of a cent, for summing before rounding."""
+    return subtotal * (PLATFORM_PER_MILLE + INTL_PER_MILLE * intl) + FLAT_FEE_CENTS * 1000
+
+
+def iso_utc(dt):
+    """Format an aware datetime like LS created_at (UTC, microseconds, no Z) for string comparison."""
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+
+def normalize_timestamp(ts):
+    """Coerce a timestamp to the canonical created_at shape iso_utc() compares against."""
+    if len(ts) == 27 and ts[-1] == "Z":
+        return ts
+    if not FROMISO_ACCEPTS_Z:
+        ts = ts.replace("Z", "+00:00")
+    dt = datetime.fromisoformat(ts)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return iso_utc(dt) + "Z"
 
 
 def filter_orders(orders, args):
@@ -80,113 +246,148 @@ def filter_orders(orders, args):
     elif args.days:
         cutoff = now - timedelta(days=args.days)
 
-    filtered = []
-    for o in orders:
-        a = o["attributes"]
-        if a.get("status") != "paid":
-            continue
-        if cutoff:
-            created = datetime.fromisoformat(a["created_at"].replace("Z", "+00:00"))
-            if created < cutoff:
-                continue
-        filtered.append(o)
-    return filtered
+    if cutoff is None:
+        return [o for o in orders if o["status"] == "paid"]
+    cutoff_iso = iso_utc(cutoff)
+    return [o for o in orders if o["status"] == "paid" and o["created_at"] >= cutoff_iso]
+
+
+def order_columns(orders):
+    """Struct-of-arrays view of orders: one int64-cent or string column per field the reports read."""
+    subtotals = array("q", [o["subtotal_usd"] for o in orders])
+    intls = array("q", [o["intl"] for o in orders])
+    return {
+        "subtotal": subtotals,
+        "tax": array("q", [o["tax_usd"] for o in orders]),
+        "fee": array("q", [fee_milli(s, i) for s, i in zip(subtotals, intls)]),
+        "intl": intls,
+        "month": [o["created_at"][:7] for o in orders],
+        "product": [o["product_name"] for o in orders],
+    }
 
 
-def print_monthly(orders):
-    """Monthly breakdown with fees."""
-    monthly = defaultdict(lambda: {"revenue": 0, "orders": 0, "fees": 0, "tax": 0, "net": 0})
+def agg_groups(codes, subtotals, fees, taxes, out_rev, out_fee, out_tax, out_n):
+    """Accumulate per-group sums into preallocated buffers indexed by code."""
+    for k, subtotal, fee, tax in zip(codes, subtotals, fees, taxes):
+        out_rev[k] += subtotal
+        out_fee[k] += fee
+        out_tax[k] += tax
+        out_n[k] += 1
+
+
+def group_totals(values, subtotals, fees, taxes):
+    """{value: {revenue, orders, fees, tax}} for one grouping column."""
+    codes, uniques = factorize(values)
+    n = len(uniques)
+    rev, fee, tax, count = [0] * n, [0] * n, [0] * n, [0] * n
+    agg_groups(codes, subtotals, fees, taxes, rev, fee, tax, count)
+    return {
+        u: {"revenue": rev[i], "orders": count[i], "fees": fee[i], "tax": tax[i]}
+        for i, u in enumerate(uniques)
+    }
 
-    for o in orders:
-        a = o["attributes"]
-        subtotal = a.get("subtotal_usd", 0) / 100
-        tax = a.get("tax_usd", 0) / 100
-        fee, _ = calc_fee(subtotal, a.get("currency", "USD"))
-        month = a["created_at"][:7]
-        monthly[month]["revenue"] += subtotal
-        monthly[month]["orders"] += 1
-        monthly[month]["fees"] += fee
-        monthly[month]["tax"] += tax
-        monthly[month]["net"] += subtotal - fee
-
-    print(f"{'Month':<10} {'Orders':>7} {'Revenue':>10} {'LS Fees':>10} {'Tax':>10} {'You Keep':>10} {'Fee %':>7}")
-    print("-" * 82)
-    for month in sorted(monthly.keys()):
-        m = monthly[month]
-        pct = (m["fees"] / m["revenue"] * 100) if m["revenue"] > 0 else 0
-        print(f"{month:<10} {m['orders']:>7} ${m['revenue']:>9.2f} ${m['fees']:>9.2f} ${m['tax']:>9.2f} ${m['net']:>9.2f} {pct:>6.1f}%")
-    print("-" * 82)
 
-    totals = {k: sum(m[k] for m in monthly.values()) for k in ["revenue", "orders", "fees", "tax", "net"]}
-    pct = (totals["fees"] / totals["revenue"] * 100) if totals["revenue"] > 0 else 0
-    print(f"{'TOTAL':<10} {int(totals['orders']):>7} ${totals['revenue']:>9.2f} ${totals['fees']:>9.2f} ${totals['tax']:>9.2f} ${totals['net']:>9.2f} {pct:>6.1f}%")
-    return totals
+def aggregate_all(orders):
+    """(monthly, products, fee_totals) for paid orders; fees in fee_milli() units, all else in cents."""
+    cols = order_columns(orders)
+    subtotals, fees, taxes = cols["subtotal"], cols["fee"], cols["tax"]
+    monthly = group_totals(cols["month"], subtotals, fees, taxes)
+    products = group_totals(cols["product"], subtotals, fees, taxes)
+    fee_totals = {
+        "revenue": sum(subtotals),
+        "intl_revenue": sum(s * i for s, i in zip(subtotals, cols["intl"])),
+        "orders": len(orders),
+    }
+    return monthly, products, fee_totals
 
 
-def print_fees(orders):
+def print_monthly(monthly):
+    """Monthly breakdown with fees."""
+    row = "{:<10} {:>7} ${:>9.2f} ${:>9.2f} ${:>9.2f} ${:>9.2f} {:>6.1f}%".format
+    lines = [
+        f"{'Month':<10} {'Orders':>7} {'Revenue':>10} {'LS Fees':>10} {'Tax':>10} {'You Keep':>10} {'Fee %':>7}",
+        "-" * 82,
+    ]
+    for month in sorted(monthly.keys()):
+        m = monthly[month]
+        fees = per_mille(m["fees"], 1)
+        pct = (fees / m["revenue"] * 100) if m["revenue"] > 0 else 0
+        lines.append(row(month, m["orders"], m["revenue"] / 100, fees / 100, m["tax"] / 100, (m["revenue"] - fees) / 100, pct))
+    lines.append("-" * 82)
+
+    totals = {k: sum(m[k] for m in monthly.values()) for k in ["revenue", "orders", "fees", "tax"]}
+    fees = per_mille(totals["fees"], 1)
+    pct = (fees / totals["revenue"] * 100) if totals["revenue"] > 0 else 0
+    lines.append(row(
+        "TOTAL", totals["orders"], totals["revenue"] / 100, fees / 100,
+        totals["tax"] / 100, (totals["revenue"] - fees) / 100, pct,
+    ))
+    write_lines(lines)
+
+
+def print_fees(fee_totals):
     """Detailed fee breakdown."""
-    total_revenue = 0
-    total_intl = 0
-    paid_count = 0
-
-    for o in orders:
-        a = o["attributes"]
-        subtotal = a.get("subtotal_usd", 0) / 100
-        _, intl = calc_fee(subtotal, a.get("currency", "USD"))
-        total_revenue += subtotal
-        total_intl += intl
-        paid_count += 1
-
-    platform_pct = total_revenue * 0.05
-    flat_fee = paid_count * 0.50
-    total_fees = platform_pct + flat_fee + total_intl
-    eff = (total_fees / total_revenue * 100) if total_revenue > 0 else 0
-
-    print()
-    print("Fee Breakdown")
-    print(f"  Platform cut (5%):            ${platform_pct:>8.2f}")
-    print(f"  Per-txn flat ($0.50 x {paid_count:<4}):   ${flat_fee:>8.2f}")
-    print(f"  International (+1.5%):        ${total_intl:>8.2f}")
-    print(f"                                ---------")
-    print(f"  Total fees to LS:             ${total_fees:>8.2f}")
-    print(f"  Effective rate:               {eff:>7.1f}%")
-    print()
-    print(f"  Gross revenue:                ${total_revenue:>8.2f}")
-    print(f"  You keep:                     ${total_revenue - total_fees:>8.2f}")
+    # Each line and the total round their exact sums once, like print_monthly
+    revenue_cents = fee_totals["revenue"]
+    paid_count = fee_totals["orders"]
+    platform_cents = per_mille(revenue_cents, PLATFORM_PER_MILLE)
+    intl_cents = per_mille(fee_totals["intl_revenue"], INTL_PER_MILLE)
+    fees_cents = per_mille(
+        revenue_cents * PLATFORM_PER_MILLE + fee_totals["intl_revenue"] * INTL_PER_MILLE
+        + paid_count * FLAT_FEE_CENTS * 1000,
+        1,
+    )
+    eff = (fees_cents / revenue_cents * 100) if revenue_cents > 0 else 0
+
+    total_revenue = revenue_cents / 100
+    platform_pct = platform_cents / 100
+    total_intl = intl_cents / 100
+    flat_fee = paid_count * FLAT_FEE_CENTS / 100
+    total_fees = fees_cents / 100
+
+    lines = [
+        "",
+        "Fee Breakdown",
+        f"  Platform cut (5%):            ${platform_pct:>8.2f}",
+        f"  Per-txn flat ($0.50 x {paid_count:<4}):   ${flat_fee:>8.2f}",
+        f"  International (+1.5%):        ${total_intl:>8.2f}",
+        "                                ---------",
+        f"  Total fees to LS:             ${total_fees:>8.2f}",
+        f"  Effective rate:               {eff:>7.1f}%",
+        "",
+        f"  Gross revenue:                ${total_revenue:>8.2f}",
+        f"  You keep:                     ${(revenue_cents - fees_cents) / 100:>8.2f}",
+    ]
 
     # Show what rate would be at different price points
     if paid_count > 0:
+        pct_rate, flat = PLATFORM_PER_MILLE / 1000, FLAT_FEE_CENTS / 100
         avg = total_revenue / paid_count
-        print()
-        print(f"  Avg order: ${avg:.2f} -> {((avg * 0.05 + 0.50) / avg * 100):.1f}% effective rate")
-        print()
-        print("  Rate at different price points:")
+        lines += [
+            "",
+            f"  Avg order: ${avg:.2f} -> {((avg * pct_rate + flat) / avg * 100):.1f}% effective rate",
+            "",
+            "  Rate at different price points:",
+        ]
         for price in [5, 10, 15, 20, 30, 50]:
-            rate = ((price * 0.05 + 0.50) / price * 100)
-            print(f"    ${price:>3} -> {rate:.1f}%")
+            rate = ((price * pct_rate + flat) / price * 100)
+            lines.append(f"    ${price:>3} -> {rate:.1f}%")
+    write_lines(lines)
 
 
-def print_products(orders):
+def print_products(products):
     """Revenue by product."""
-    products = defaultdict(lambda: {"revenue": 0, "orders": 0, "fees": 0})
-
-    for o in orders:
-        a = o["attributes"]
-        item = a.get("first_order_item") or {}
-        name = item.get("product_name", "Unknown")
-        subtotal = a.get("subtotal_usd", 0) / 100
-        fee, _ = calc_fee(subtotal, a.get("currency", "USD"))
-        products[name]["revenue"] += subtotal
-        products[name]["orders"] += 1
-        products[name]["fees"] += fee
-
-    print()
-    print(f"{'Product':<30} {'Orders':>7} {'Revenue':>10} {'LS Fees':>10} {'You Keep':>10}")
-    print("-" * 72)
+    row = "{:<30} {:>7} ${:>9.2f} ${:>9.2f} ${:>9.2f}".format
+    lines = [
+        "",
+        f"{'Product':<30} {'Orders':>7} {'Revenue':>10} {'LS Fees':>10} {'You Keep':>10}",
+        "-" * 72,
+    ]
     for name in sorted(products, key=lambda n: products[n]["revenue"], reverse=True):
         p = products[name]
-        net = p["revenue"] - p["fees"]
-        print(f"{name[:29]:<30} {p['orders']:>7} ${p['revenue']:>9.2f} ${p['fees']:>9.2f} ${net:>9.2f}")
+        fees = per_mille(p["fees"], 1)
+        lines.append(row(name[:29], p["orders"], p["revenue"] / 100, fees / 100, (p["revenue"] - fees) / 100))
+    write_lines(lines)
 
 
 def print_daily(all_orders):
@@ -196,6 +397,9 @@ def print_daily(all_orders):
     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
     yesterday_start = today_start - timedelta(days=1)
     week_start = today_start - timedelta(days=7)
+    today_iso = iso_utc(today_start)
+    yesterday_iso = iso_utc(yesterday_start)
+    week_iso = iso_utc(week_start)
 
     buckets = {
         "Today": {"orders": 0, "revenue": 0, "fees": 0},
@@ -205,76 +409,67 @@ def print_daily(all_orders):
     }
 
     for o in all_orders:
-        a = o["attributes"]
-        if a.get("status") != "paid":
+        if o["status"] != "paid":
             continue
-        subtotal = a.get("subtotal_usd", 0) / 100
-        fee, _ = calc_fee(subtotal, a.get("currency", "USD"))
-        created = datetime.fromisoformat(a["created_at"].replace("Z", "+00:00"))
+        subtotal = o["subtotal_usd"]
+        fee = fee_milli(subtotal, o["intl"])
+        created = o["created_at"]
 
         buckets["All Time"]["orders"] += 1
         buckets["All Time"]["revenue"] += subtotal
         buckets["All Time"]["fees"] += fee
 
-        if created >= week_start:
+        if created >= week_iso:
             buckets["This Week"]["orders"] += 1
             buckets["This Week"]["revenue"] += subtotal
             buckets["This Week"]["fees"] += fee
 
-        if created >= today_start:
+        if created >= today_iso:
             buckets["Today"]["orders"] += 1
             buckets["Today"]["revenue"] += subtotal
             buckets["Today"]["fees"] += fee
-        elif created >= yesterday_start:
+        elif created >= yesterday_iso:
             buckets["Yesterday"]["orders"] += 1
             buckets["Yesterday"]["revenue"] += subtotal
             buckets["Yesterday"]["fees"] += fee
 
-    print(f"{'Period':<15} {'Orders':>7} {'Revenue':>10} {'LS Fees':>10} {'You Keep':>10}")
-    print("-" * 55)
+    row = "{:<15} {:>7} ${:>9.2f} ${:>9.2f} ${:>9.2f}".format
+    lines = [f"{'Period':<15} {'Orders':>7} {'Revenue':>10} {'LS Fees':>10} {'You Keep':>10}", "-" * 55]
     for name in ["Today", "Yesterday", "This Week", "All Time"]:
         b = buckets[name]
-        net = b["revenue"] - b["fees"]
-        print(f"{name:<15} {b['orders']:>7} ${b['revenue']:>9.2f} ${b['fees']:>9.2f} ${net:>9.2f}")
+        fees = per_mille(b["fees"], 1)
+        lines.append(row(name, b["orders"], b["revenue"] / 100, fees / 100, (b["revenue"] - fees) / 100))
 
     # Recent orders (last 5)
-    recent = sorted(
-        [o for o in all_orders if o["attributes"].get("status") == "paid"],
-        key=lambda o: o["attributes"]["created_at"],
-        reverse=True,
-    )[:5]
+    recent = heapq.nlargest(
+        5,
+        (o for o in all_orders if o["status"] == "paid"),
+        key=lambda o: o["created_at"],
+    )
     if recent:
-        print()
-        print("Recent Orders:")
+        lines += ["", "Recent Orders:"]
         for o in recent:
-            a = o["attributes"]
-            item = a.get("first_order_item") or {}
-            name = item.get("product_name", "Unknown")
-            subtotal = a.get("subtotal_usd", 0) / 100
-            date = a["created_at"][:10]
-            print(f"  {date}  ${subtotal:.2f}  {name}")
+            lines.append(f"  {o['created_at'][:10]}  ${o['subtotal_usd'] / 100:.2f}  {o['product_name']}")
+    write_lines(lines)
 
 
 def print_json(orders):
     """Raw JSON output for piping."""
     result = []
     for o in orders:
-        a = o["attributes"]
-        subtotal = a.get("subtotal_usd", 0) / 100
-        fee, intl = calc_fee(subtotal, a.get("currency", "USD"))
-        item = a.get("first_order_item") or {}
+        subtotal = o["subtotal_usd"]
+        fee = order_fee(subtotal, o["intl"])
         result.append({
-            "date": a["created_at"][:10],
-            "product": item.get("product_name", "Unknown"),
-            "subtotal": subtotal,
-            "tax": a.get("tax_usd", 0) / 100,
-            "fee": round(fee, 2),
-            "net": round(subtotal - fee, 2),
-            "currency": a.get("currency", "USD"),
-            "refunded": a.get("refunded", False),
+            "date": o["created_at"][:10],
+            "product": o["product_name"],
+            "subtotal": subtotal / 100,
+            "tax": o["tax_usd"] / 100,
+            "fee": fee / 100,
+            "net": (subtotal - fee) / 100,
+            "currency": o["currency"],
+            "refunded": o["refunded"],
         })
-    json.dump(result, sys.stdout, indent=2)
-    print()
+    sys.stdout.write(json_dumps(result, indent=True) + "\n")
 
 
 def main():
@@ -285,10 +480,11 @@ def main():
     parser.add_argument("--fees", action="store_true", help="Fee breakdown only")
     parser.add_argument("--products", action="store_true", help="Revenue by product")
     parser.add_argument("--json", action="store_true", help="Raw JSON output")
+    parser.add_argument("--refresh", action="store_true", help="Bypass the on-disk order and API key caches")
     args = parser.parse_args()
 
-    api_key = get_api_key()
-    all_orders = fetch_orders(api_key)
+    api_key = get_api_key("LEMONSQUEEZY_API_KEY", KEY_SERVICE, "LemonSqueezy", use_cache=not args.refresh)
+    all_orders = fetch_orders(api_key, use_cache=not args.refresh)
 
     # --daily uses all orders (does its own bucketing)
     if args.daily:
@@ -319,15 +515,16 @@ def main():
     print(f"LemonSqueezy Report — {label} ({len(orders)} orders)")
     print()
 
+    monthly, products, fee_totals = aggregate_all(orders)
     if args.fees:
-        print_fees(orders)
+        print_fees(fee_totals)
     elif args.products:
-        print_products(orders)
+        print_products(products)
     else:
-        print_monthly(orders)
-        print_fees(orders)
+        print_monthly(monthly)
+        print_fees(fee_totals)
         print()
-        print_products(orders)
+        print_products(products)
 
 
 if __name__ == "__main__":